@@ -2,6 +2,7 @@
 import os
 import dateutil.parser
 import helper as h
+import store as s
 
 import matplotlib
 matplotlib.use('TkAgg')
@@ -14,11 +15,13 @@ data_path = os.path.join(project_path, 'data/')
 
 
 # Plot the ending totals of classification values
-def plot_confusion(data):
+def plot_confusion(modified, probability):
     labels = ['True Positive', 'True Negative',
               'False Positive', 'False Negative']
     colors = ['green', 'limegreen', 'red', 'darkorange']
 
+    data = [{'modified': m, 'probability': p}
+            for m, p in zip(modified, probability)]
     values, scores = h.compute_scores(data)
     
     print('Overall F1 Score (Modified): ', scores[0])
@@ -30,38 +33,38 @@ def plot_confusion(data):
 
 
 # Plot the progression of the misclassification error rate
-def plot_error(data):
+def plot_error(errors, b):
     x, y = [], []
-    for index, entry in enumerate(data, 1):
+    for index, error in enumerate(errors, 1):
         x.append(index)
-        y.append(float(entry['error']))
+        y.append(float(error))
            
     plt.scatter(x, y)
-    plt.title(f"Misclassification Rate (B{data[0]['bundle']})")
+    plt.title(f"Misclassification Rate (B{b})")
     plt.xlabel('Entry Number')
     plt.ylabel('Error Rate (Percentage)')
     plt.grid(linestyle='--')
 
 
 # Plot the progression of the cross entropy rate
-def plot_entropy(data):
+def plot_entropy(entropies, b):
     x, y = [], []
-    for index, entry in enumerate(data, 1):
+    for index, entropy in enumerate(entropies, 1):
         x.append(index)
-        y.append(float(entry['entropy']))
+        y.append(float(entropy))
            
     plt.scatter(x, y)
-    plt.title(f"Entropy Rate (B{data[0]['bundle']})")
+    plt.title(f"Entropy Rate (B{b})")
     plt.xlabel('Entry Number')
     plt.ylabel('Entropy Rate (Percentage)')
     plt.grid(linestyle='--')
 
 
 # Plot the histogram of entry start/end times
-def plot_times(data, target):
+def plot_times(values, target):
     times = []
-    for entry in data:
-        date = dateutil.parser.parse(entry[target])
+    for value in values:
+        date = dateutil.parser.parse(value)
         times.append(date.hour)
   
     plt.hist(times)
@@ -73,10 +76,10 @@ def plot_times(data, target):
 
 
 # Plot the histogram of entry durations
-def plot_duration(data):
+def plot_duration(values):
     durations = []
-    for entry in data:
-        minutes = (int(entry['duration'])/1000) / 60
+    for value in values:
+        minutes = (int(value)/1000) / 60
         durations.append(round(minutes))
       
     plt.hist(durations)
@@ -117,11 +120,11 @@ def plot_entropy_overall(data):
 
 
 # Plot the progression of modified entry totals
-def plot_modified(data):
+def plot_modified(modified):
     value = 0
     x, y = [], []
-    for index, entry in enumerate(data, 1):
-        value += (1 if entry['modified'] == 'True' else -1)
+    for index, entry in enumerate(modified, 1):
+        value += (1 if entry == 'True' else -1)
         x.append(index)
         y.append(value)
     
@@ -136,65 +139,86 @@ def plot_modified(data):
 def analyse(b):
     print('\nANALYSE:')
 
-    # Open processed model and output data
-    with open(os.path.join(data_path, 'model.csv')) as model_file, \
+    # Map processed model columns and open output data
+    with s.open_model(os.path.join(data_path, 'model.bin')) as model, \
          open(os.path.join(data_path, 'output.csv')) as output_file:
-        model = h.open_csv(model_file)
         output = h.open_csv(output_file)
-    
+        analyse_model(model, output, b)
+
+
+# Draw confusion matrix and given bundle's error and entropy progression
+def figure_results(model, b):
+    modified = s.read_column(model, 'modified')
+
     # Show confusion matrix values in pie chart
-    plt.figure(num=1, figsize=(14, 4))
+    figure = plt.figure(num=1, figsize=(14, 4))
     plt.subplot(1, 3, 1)
-    plot_confusion(model)
+    plot_confusion(modified, s.read_column(model, 'probability'))
 
-    # Find and store given bundle of data
-    bundle = []
-    for entry in model:
-        bundle.append(entry) if int(entry['bundle']) == b else None
-    
-    # Show misclassification rate in scatter plot
+    # Show misclassification rate of given bundle in scatter plot
     plt.subplot(1, 3, 2)
-    plot_error(bundle)
+    plot_error(s.read_column(model, 'error', b), b)
 
-    # Show cross entropy rate in scatter plot
+    # Show cross entropy rate of given bundle in scatter plot
     plt.subplot(1, 3, 3)
-    plot_entropy(bundle)
+    plot_entropy(s.read_column(model, 'entropy', b), b)
+    return figure
+
+
+# Draw distributions of entry start/end times and durations
+def figure_times(model):
 
-    print('Showing confusion, misclassification, and entropy results')
-    plt.show()
-    
     # Show distribution of starting times
-    plt.figure(num=2, figsize=(14, 4))
+    figure = plt.figure(num=2, figsize=(14, 4))
     plt.subplot(1, 3, 1)
-    plot_times(model, 'start')
+    plot_times(s.read_column(model, 'start'), 'start')
 
     # Show distribution of ending times
     plt.subplot(1, 3, 2)
-    plot_times(model, 'end')
+    plot_times(s.read_column(model, 'end'), 'end')
 
     # Show distribution of entry durations
     plt.subplot(1, 3, 3)
-    plot_duration(model)
+    plot_duration(s.read_column(model, 'duration'))
+    return figure
 
-    print('Showing time distribution results')
-    plt.show()
+
+# Draw distributions of dataset misclassification and entropy rates
+def figure_overall(output):
 
     # Show distribution of dataset misclassification rates
-    plt.figure(num=3, figsize=(10, 4))
+    figure = plt.figure(num=3, figsize=(10, 4))
     plt.subplot(1, 2, 1)
     plot_error_overall(output)
 
     # Show distribution of dataset entropy rates
     plt.subplot(1, 2, 2)
     plot_entropy_overall(output)
-    
-    print('Showing overall distribution results')
+    return figure
+
+
+# Draw breakdown of modified entries over time
+def figure_modified(model):
+    figure = plt.figure(num=4, figsize=(6, 4))
+    plot_modified(s.read_column(model, 'modified'))
+    return figure
+
+
+# Show all figures for the mapped model columns and output data
+def analyse_model(model, output, b):
+    figure_results(model, b)
+    print('Showing confusion, misclassification, and entropy results')
+    plt.show()
+
+    figure_times(model)
+    print('Showing time distribution results')
     plt.show()
 
-    # Show breakdown of modified entries over time
-    plt.figure(num=4, figsize=(6, 4))
-    plot_modified(model)
+    figure_overall(output)
+    print('Showing overall distribution results')
+    plt.show()
 
+    figure_modified(model)
     print('Showing breakdown of modified entries')
     plt.show()
 
@@ -0,0 +1,170 @@
+# Asynchronous client for the Toggl web API, streaming time entries by page
+import math
+import random
+import asyncio
+import datetime
+import itertools
+import contextlib
+import collections
+import email.utils
+import aiohttp
+
+
+# Global variables
+headers = {'Content-Type': 'application/json'}
+workspace_url = 'https://toggl.com/api/v8/workspaces'
+details_url = 'https://toggl.com/reports/api/v2/details'
+page_size = 50
+
+
+# Module variable definitions:
+#   concurrency:    Maximum number of requests in flight at once
+#   retries:        Number of times a failed request is retried
+#   backoff:        Base delay in seconds, doubled after every failed attempt
+#   urls:           Endpoint overrides, e.g. to point at a local fake server
+#   interval:       Minimum time in seconds between request starts
+#   window:         Maximum number of report pages fetched ahead of the reader
+
+# NOTE: Rate-limited (429) and server error (5xx) responses are retried, as
+#   are connection failures.  A Retry-After header holds off all requests
+#   until it passes, otherwise a random time up to the current backoff is used
+
+
+# Open a client session sharing one connection pool per host
+@contextlib.asynccontextmanager
+async def create_client(api_token, concurrency=4, retries=5, backoff=1.0,
+                        urls=None, interval=1.0, window=None):
+    connector = aiohttp.TCPConnector(limit_per_host=concurrency)
+    auth = aiohttp.BasicAuth(api_token, 'api_token')
+
+    async with aiohttp.ClientSession(connector=connector, auth=auth,
+                                     headers=headers) as session:
+        client = {'session': session,
+                  'semaphore': asyncio.Semaphore(concurrency),
+                  'lock': asyncio.Lock(), 'next': 0.0, 'hold': 0.0,
+                  'interval': interval,
+                  'window': window or concurrency,
+                  'retries': retries, 'backoff': backoff,
+                  'workspace_url': workspace_url, 'details_url': details_url}
+        client.update(urls or {})
+        yield client
+
+
+# Find whether a response status is worth retrying
+def is_retryable(status):
+    return status == 429 or status >= 500
+
+
+# Find the number of seconds a response asks to wait before retrying
+def retry_after(res):
+    value = res.headers.get('Retry-After')
+    if value is None:
+        return None
+
+    # Header holds either a number of seconds or an HTTP date
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (date - now).total_seconds())
+
+
+# Hold off the start of every further request by the given number of seconds
+def postpone(client, delay):
+    start = asyncio.get_running_loop().time() + delay
+    client['hold'] = max(client['hold'], start)
+
+
+# Wait for the next free request start, spacing starts by the interval and
+#   taking a new turn if the server asked to hold off in the meantime
+async def wait_turn(client):
+    loop = asyncio.get_running_loop()
+    while True:
+        async with client['lock']:
+            now = loop.time()
+            start = max(now, client['next'], client['hold'])
+            client['next'] = start + client['interval']
+
+        await asyncio.sleep(start - now)
+        if client['hold'] <= start:
+            return
+
+
+# Make HTTP request against Toggl web endpoint, retrying with jittered backoff
+async def api_request(client, url, payload):
+    for attempt in range(client['retries'] + 1):
+        last = (attempt == client['retries'])
+        delay = None
+
+        try:
+            await wait_turn(client)
+            async with client['semaphore']:
+                async with client['session'].get(url, params=payload) as res:
+                    if not is_retryable(res.status) or last:
+                        res.raise_for_status()
+                        return await res.json()
+                    delay = retry_after(res)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if last:
+                raise
+
+        # Wait as long as the server asks, or a random time up to the
+        #   exponential backoff, before retrying
+        if delay is not None:
+            postpone(client, delay)
+        else:
+            delay = client['backoff'] * (2 ** attempt)
+            await asyncio.sleep(random.uniform(0, delay))
+
+
+# Find the ID number of the account's first workspace
+async def fetch_workspace(client):
+    workspaces = await api_request(client, client['workspace_url'], {})
+    return workspaces[0]['id']
+
+
+# Retrieve one page of the detailed report
+async def fetch_page(client, payload, page):
+    return await api_request(client, client['details_url'],
+                             dict(payload, page=page))
+
+
+# Iterate over all time entries of the detailed report, in page order
+async def iterate_entries(client, payload):
+
+    # First page determines the number of pages left to fetch
+    first = await fetch_page(client, payload, 1)
+    pages = math.ceil(first['total_count'] / page_size)
+    print(f"Found {first['total_count']} entries on {pages} pages")
+    for entry in first['data']:
+        yield entry
+
+    # Fetch remaining pages in a bounded window ahead of the reader,
+    #   yielding each page as its turn comes and then refilling the window
+    remaining = iter(range(2, pages + 1))
+    tasks = collections.deque(
+        asyncio.ensure_future(fetch_page(client, payload, page))
+        for page in itertools.islice(remaining, client['window']))
+    try:
+        for page in range(2, pages + 1):
+            data = (await tasks.popleft())['data']
+            for upcoming in itertools.islice(remaining, 1):
+                tasks.append(asyncio.ensure_future(
+                    fetch_page(client, payload, upcoming)))
+
+            print(f'Received page #{page} of {pages}')
+            for entry in data:
+                yield entry
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# DEBUG
+if __name__ == '__main__':
+    print('ERROR: client.py should not be executed on its own')
@@ -1,12 +1,22 @@
 # Contains helper functions for the toggl-ml project
 import csv
 import math
-import random
 import dateutil.parser
+import numpy as np
 
 
 # Global variables
 feature_list = ['project', 'description', 'tags']
+category_prior = 1
+unknown_id = 0
+
+
+# NOTE: Known categories start from category_prior counts for both outcomes.
+#   The prior is added when counts are read rather than stored with them, so
+#   decayed counts fall back to the prior and never reach zero
+
+# NOTE: Feature values are stored as integer ids from the category dictionary
+#   built by preprocess.py, where id 0 is the 'Unknown' category
 
 
 # UNIVERSAL HELPERS
@@ -20,6 +30,53 @@ def open_csv(file):
     return data
 
 
+# Iterate over the rows of data .csv file as dictionaries, one at a time
+def iterate_csv(file):
+    yield from csv.DictReader(file)
+
+
+# Convert one encoded .csv line to a dictionary keyed by the header
+def decode_row(header, line):
+    return dict(zip(header, next(csv.reader([line.decode('utf-8')]))))
+
+
+# Iterate over the rows of a data .csv file opened in binary mode as
+#   dictionaries, starting from the last row
+#   NOTE: Rows must not span lines, i.e. contain no quoted line breaks
+def open_csv_reversed(file, size=65536):
+    header = next(csv.reader([file.readline().decode('utf-8')]))
+    start = file.tell()
+    position = file.seek(0, 2)
+
+    # Read blocks back from the end, carrying the partial first line over
+    remainder = b''
+    while position > start:
+        step = min(size, position - start)
+        position -= step
+        file.seek(position)
+        lines = (file.read(step) + remainder).split(b'\n')
+        remainder = lines.pop(0)
+        for line in reversed(lines):
+            if line.strip():
+                yield decode_row(header, line)
+
+    if remainder.strip():
+        yield decode_row(header, remainder)
+
+
+# Load the persistent category dictionary as a list of values per feature,
+#   indexed by category id
+def open_categories(file):
+    categories = {feature: ['Unknown'] for feature in feature_list}
+    for row in open_csv(file):
+        values = categories[row['feature']]
+        if int(row['id']) != len(values):
+            raise ValueError(f"Category ids for '{row['feature']}' are not "
+                             f"in order at id {row['id']}")
+        values.append(row['value'])
+    return categories
+
+
 # Calculate the F1 and F2 scores for the given entry values
 def compute_scores(bundle):
     scores = [0, 0]
@@ -56,73 +113,114 @@ def compute_scores(bundle):
 
 # LEARN HELPERS
 
-# Examine distribution of time data to find value for hyperparameter kappa
-def compute_kappa(data, target):
-
-    # Find mean of target time feature
-    mean = 0
-    hours = []
+# Find mean hour angle of each target time feature over the entries
+def compute_means(data, targets):
+    count = 0
+    means = [0] * len(targets)
     for entry in data:
-        hour = (dateutil.parser.parse(entry[target]).hour / 24) * (2*math.pi)   
-        mean += hour
-        hours.append(hour)
-    mean /= len(hours)
+        for i, target in enumerate(targets):
+            means[i] += (dateutil.parser.parse(entry[target]).hour / 24) \
+                        * (2*math.pi)
+        count += 1
+    return [mean / count for mean in means]
+
+
+# Examine distribution of time data to find values for hyperparameter kappa,
+#   in a second pass over the entries given the means of each target
+def compute_kappas(data, targets, means):
+    count = 0
+    variances = [0] * len(targets)
+    for entry in data:
+        for i, target in enumerate(targets):
+            hour = (dateutil.parser.parse(entry[target]).hour / 24) \
+                   * (2*math.pi)
+            variances[i] += (hour - means[i])**2
+        count += 1
+    return [1 / (2*(variance / count)) for variance in variances]
 
-    # Calculate variance from list of time hours
-    variance = 0
-    for hour in hours:
-        variance += (hour - mean)**2
-    variance /= len(hours)
 
-    kappa = 1 / (2*variance)
-    return kappa
+# Examine distribution of time data to find value for hyperparameter kappa
+def compute_kappa(data, target):
+    means = compute_means(data, [target])
+    return compute_kappas(data, [target], means)[0]
 
 
-# Creates inital empty list of feature category values
+# Creates inital empty counts for each feature, keyed by category id so only
+#   the categories counted in the bundle take up space
 def setup_beta():
     beta = {}
     
     for feature in feature_list:
-        beta.setdefault(feature, {'Unknown':
-            {'True': 0, 'False': 0, 'Total': 0}})
+        beta.setdefault(feature, {'True': {unknown_id: 0},
+                                  'False': {unknown_id: 0},
+                                  'Total': {unknown_id: 0}, 'Known': 0})
     return beta
 
 
-# Count new entry of feature category information
-def update_beta(entry, beta):
-    for key, value in entry.items():
-        if key not in feature_list:
-            break
-        elif value not in beta.values():
-
-            # New values add to the 'Unknown' category
-            beta[key]['Unknown'][entry['modified']] += 1
-            beta[key]['Unknown']['Total'] += 1
-            beta[key].setdefault(value, {'True': 1, 'False': 1, 'Total': 1})
-            
-        beta[key][value][entry['modified']] += 1
-        beta[key][value]['Total'] += 1
-    return beta
+# Count new entry of feature category id, keeping alpha totals current
+#   weight:     Amount added per count, above 1 while counts are being decayed
+def update_beta(counts, value, modified, alpha, weight=1):
+    key = ('True' if modified else 'False')
+
+    # New values add to the 'Unknown' category
+    counts[key][unknown_id] += weight
+    counts['Total'][unknown_id] += weight
+    if value not in counts['Total']:
+        counts['Known'] += 1
+        for name in ['True', 'False', 'Total']:
+            counts[name][value] = 0
+
+    counts[key][value] += weight
+    counts['Total'][value] += weight
+    alpha[modified] += 2 * weight
+    return alpha
 
 
 # Find number of entries that were manually updated
 def compute_alpha(beta):
     alpha = [0, 0]
 
-    for feature, categories in beta.items():
-        for category in categories:
-            alpha[0] += beta[feature][category]['False']
-            alpha[1] += beta[feature][category]['True']
+    for counts in beta.values():
+        alpha[0] += sum(counts['False'].values())
+        alpha[1] += sum(counts['True'].values())
     return alpha
 
 
-# Compute sum of logarithmic beta probabilities for the entry's feature category
-def sum_log_ratios(entry, beta):
+# Multiply all feature category counts by scale, forgetting any known
+#   category whose scaled total falls below limit, and recount alpha totals
+def rescale_beta(beta, scale, limit):
+    for counts in beta.values():
+        kept = [value for value, total in counts['Total'].items()
+                if value == unknown_id or total * scale >= limit]
+        counts['Known'] -= len(counts['Total']) - len(kept)
+
+        # Rebuild the counts so forgotten categories free their space
+        for key in ['True', 'False', 'Total']:
+            counts[key] = {value: counts[key][value] * scale
+                           for value in kept}
+    return compute_alpha(beta)
+
+
+# Compute prior probability of an entry being modified, termed as theta
+def compute_theta(beta, alpha, scale=1):
+    known = sum(counts['Known'] for counts in beta.values())
+    prior = known * category_prior
+
+    # Without any counts yet, neither outcome is favoured
+    modified = (alpha[1] * scale) + prior
+    total = (alpha[0] * scale) + prior + modified
+    return (modified / total if total else 0.5)
+
+
+# Compute sum of logarithmic beta probabilities for the entry's feature values
+def sum_log_ratios(beta, values, scale=1):
     log_sum = 0.0
 
-    for feature in feature_list:
-        log_sum += math.log(beta[feature][entry[feature]]['True'] /
-                            beta[feature][entry[feature]]['False'])
+    for feature, value in zip(feature_list, values):
+        counts = beta[feature]
+        prior = (category_prior if value != unknown_id else 0)
+        log_sum += math.log(((counts['True'].get(value, 0) * scale) + prior) /
+                            ((counts['False'].get(value, 0) * scale) + prior))
     return log_sum
 
 
@@ -143,13 +241,48 @@ def update_hyperparameters(x, a, b, kappa):
     return (a_prime, b_prime)
 
 
+# Create independent random streams for parallel workers from one seed
+def spawn_seeds(seed, workers):
+    return np.random.SeedSequence(seed).spawn(workers)
+
+
 # Randomly select seeds for testing datasets from provided bundle values
-def compute_seeds(bundles, sets):
-    seeds = []
-    for _ in range(sets):
-        length = len(bundles)
-        seed = [random.choice(range(length)) for i in range(length)]
-        seeds.append(seed)
+#   method:     'uniform' draws any bundle, 'block' draws runs of consecutive
+#               bundles of the given block size, and 'stratified' draws
+#               within each group of bundles sharing a strata label
+#   seed:       Integer or SeedSequence (see spawn_seeds), None is unseeded
+def compute_seeds(bundles, sets, seed=None, method='uniform', block=1,
+                  strata=None):
+    rng = np.random.default_rng(seed)
+    length = len(bundles)
+
+    if method == 'uniform':
+        seeds = rng.integers(0, length, size=(sets, length))
+
+    elif method == 'block':
+        if not 1 <= block <= length:
+            raise ValueError(f"Block size must be between 1 and {length}")
+
+        # Pick random block starts, then trim the joined blocks to length
+        count = math.ceil(length / block)
+        starts = rng.integers(0, length - block + 1, size=(sets, count))
+        seeds = (starts[:, :, None] + np.arange(block)).reshape(sets, -1)
+        seeds = seeds[:, :length]
+
+    elif method == 'stratified':
+        if strata is None or len(strata) != length:
+            raise ValueError('Stratified seeds need a label for every bundle')
+
+        # Resample each stratum in place, keeping the stratum sizes fixed
+        strata = np.asarray(strata)
+        seeds = np.empty((sets, length), dtype=np.int64)
+        for label in np.unique(strata):
+            members = np.flatnonzero(strata == label)
+            draws = rng.integers(0, len(members), size=(sets, len(members)))
+            seeds[:, members] = members[draws]
+
+    else:
+        raise ValueError(f"Unknown seed method '{method}'")
     return seeds
 
 
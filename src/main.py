@@ -18,13 +18,17 @@ from analyse import analyse
 #   days:           Number of days to split data training bundles into
 #   sets:           Number of datasets to generate and train on
 #   bundle:         Plot the given bundle's value
+#   seed:           Random seed for generating datasets (None is unseeded)
+#   decay:          Forgetting factor for model state, above 0.0 and at most
+#                   1.0 (1.0 is off)
+#   stream:         Train one bundle at a time without loading all data
 
 # NOTE: The three size variables must sum to 1.0, else an error is thrown
 
 
 # Run probability classifiers on time entry data from Toggl account
 def main(since, until, size_train, size_test, size_validate,
-         days, sets, bundle):
+         days, sets, bundle, seed=None, decay=1.0, stream=False):
     print('\nMAIN:')
 
     # Export all data from Toggl account
@@ -34,7 +38,7 @@ def main(since, until, size_train, size_test, size_validate,
     preprocess(size_train, size_test, size_validate)
     
     # Run learning model on the training data set, printing outcomes
-    learn(days, sets)
+    learn(days, sets, seed, decay, stream)
 
     # Show visual results of learning model of training data
     analyse(bundle)
@@ -2,6 +2,7 @@
 import os
 import csv
 import random
+import helper as h
 
 
 # Global variables
@@ -31,6 +32,40 @@ def split(data, size_train, size_test, size_validate):
     return (train, test, validate)
 
 
+# Load the category dictionary, starting empty if none has been saved yet
+def load_categories(path):
+    if not os.path.exists(path):
+        return {feature: ['Unknown'] for feature in h.feature_list}
+    with open(path) as file:
+        return h.open_categories(file)
+
+
+# Save the category dictionary, one row per non-'Unknown' feature value
+def save_categories(path, categories):
+    with open(path, 'w') as file:
+        writer = csv.writer(file)
+        writer.writerow(['feature', 'id', 'value'])
+        for feature, values in categories.items():
+            for index, value in enumerate(values[1:], 1):
+                writer.writerow([feature, index, value])
+
+
+# Replace feature values with their category ids, adding new values to the
+#   dictionary if extend is set, else mapping them to the 'Unknown' id
+def encode(header, data, categories, extend):
+    for feature, values in categories.items():
+        column = header.index(feature)
+        ids = {value: index for index, value in enumerate(values)}
+
+        for row in data:
+            value = row[column]
+            if value not in ids and extend:
+                ids[value] = len(values)
+                values.append(value)
+            row[column] = ids.get(value, h.unknown_id)
+    return data
+
+
 # Create .csv file from set of entries
 def create_file(header, data, file):
     writer = csv.writer(file)
@@ -39,7 +74,9 @@ def create_file(header, data, file):
 
 
 # Prepare data for learning model
-def preprocess(size_train, size_test, size_validate):
+#   data_path:  Directory holding data.csv, where the sets and the category
+#               dictionary are written
+def preprocess(size_train, size_test, size_validate, data_path=data_path):
     print('\nPREPROCESS:')
 
     # Verify set sizes add to 1
@@ -53,9 +90,17 @@ def preprocess(size_train, size_test, size_validate):
         header = next(reader)
         data = list(reader)
 
-    # Split time entries into three separate files
+    # Split time entries into three separate sets
     train, test, validate = split(data, size_train, size_test, size_validate)
 
+    # Encode features as category ids, only adding values seen in training
+    path = os.path.join(data_path, 'categories.csv')
+    categories = load_categories(path)
+    train = encode(header, train, categories, True)
+    test = encode(header, test, categories, False)
+    validate = encode(header, validate, categories, False)
+    save_categories(path, categories)
+
     with open(os.path.join(data_path, 'train.csv'), 'w') as train_file, \
          open(os.path.join(data_path, 'test.csv'), 'w') as test_file, \
          open(os.path.join(data_path, 'validate.csv'), 'w') as validate_file:
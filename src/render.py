@@ -0,0 +1,107 @@
+# Render analysis figures for many bundles to image files in parallel
+import os
+import itertools
+import contextlib
+import concurrent.futures
+import helper as h
+import store as s
+import analyse as a
+
+import matplotlib.pyplot as plt
+plt.switch_backend('Agg')
+
+
+# Global variables
+project_path = os.getcwd()
+data_path = os.path.join(project_path, 'data/')
+figure_path = os.path.join(project_path, 'figures/')
+
+worker = {}
+
+
+# Module variable definitions:
+#   bundles:        Bundle numbers to render, or None to render every bundle
+#   fmt:            Image file format, e.g. 'png' or 'svg'
+#   workers:        Number of rendering processes (None uses all CPUs)
+
+# NOTE: Each worker maps model.bin once when it starts, so every process
+#   shares the same page cache copy of the model instead of parsing its own
+
+
+# Map the model file for the lifetime of a worker process
+def open_worker(path):
+    worker['stack'] = contextlib.ExitStack()
+    worker['model'] = worker['stack'].enter_context(s.open_model(path))
+
+
+# Save the current figure to the figures directory and release it
+def save_figure(figure, name, fmt):
+    path = os.path.join(figure_path, f"{name}.{fmt}")
+    figure.savefig(path, format=fmt)
+    plt.close(figure)
+    return path
+
+
+# Draw and save the error and entropy progression of one bundle
+def render_bundle(b, fmt):
+    model = worker['model']
+
+    # Show misclassification rate in scatter plot
+    figure = plt.figure(figsize=(10, 4))
+    plt.subplot(1, 2, 1)
+    a.plot_error(s.read_column(model, 'error', b), b)
+
+    # Show cross entropy rate in scatter plot
+    plt.subplot(1, 2, 2)
+    a.plot_entropy(s.read_column(model, 'entropy', b), b)
+    return save_figure(figure, f"bundle_{b}", fmt)
+
+
+# Draw and save the figures covering the whole model and output data
+def render_overview(model, output, fmt):
+    paths = []
+
+    # Show confusion matrix values in pie chart
+    figure = plt.figure(figsize=(6, 4))
+    a.plot_confusion(s.read_column(model, 'modified'),
+                     s.read_column(model, 'probability'))
+    paths.append(save_figure(figure, 'confusion', fmt))
+
+    paths.append(save_figure(a.figure_times(model), 'times', fmt))
+    paths.append(save_figure(a.figure_overall(output), 'overall', fmt))
+    paths.append(save_figure(a.figure_modified(model), 'modified', fmt))
+    return paths
+
+
+# Write analysis figures for all or the selected bundles to image files
+def render(bundles=None, fmt='png', workers=None):
+    print('\nRENDER:')
+    model_path = os.path.join(data_path, 'model.bin')
+    os.makedirs(figure_path, exist_ok=True)
+
+    # Save the overview figures and find the bundles to render
+    with s.open_model(model_path) as model, \
+         open(os.path.join(data_path, 'output.csv')) as output_file:
+        output = h.open_csv(output_file)
+        paths = render_overview(model, output, fmt)
+
+        selected = sorted(model['bundles'] if bundles is None else bundles)
+        for b in selected:
+            if b not in model['bundles']:
+                raise KeyError(f"Unknown model bundle '{b}'")
+
+    # Spread the bundle figures over a pool of rendering processes
+    workers = workers or os.cpu_count()
+    chunksize = max(1, len(selected) // (workers * 4))
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=open_worker, initargs=(model_path,)) as pool:
+        paths.extend(pool.map(render_bundle, selected,
+                              itertools.repeat(fmt), chunksize=chunksize))
+
+    print(f"Saved {len(paths)} figures to {figure_path}")
+    return paths
+
+
+# DEBUG
+if __name__ == '__main__':
+    render()
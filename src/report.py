@@ -0,0 +1,208 @@
+# Compare speed and accuracy of pipeline variants against a stored baseline
+import io
+import os
+import csv
+import sys
+import time
+import statistics
+import shutil
+import tempfile
+import tracemalloc
+import contextlib
+import multiprocessing
+import concurrent.futures
+import helper as h
+from preprocess import preprocess
+from learn import learn
+
+
+# Global variables
+project_path = os.getcwd()
+data_path = os.path.join(project_path, 'data/')
+
+variant_list = [
+    {'name': 'weekly', 'days': 7, 'engine': 'memory',
+     'split': [0.6, 0.2, 0.2], 'decay': 1.0},
+    {'name': 'weekly-stream', 'days': 7, 'engine': 'stream',
+     'split': [0.6, 0.2, 0.2], 'decay': 1.0},
+    {'name': 'daily', 'days': 1, 'engine': 'memory',
+     'split': [0.6, 0.2, 0.2], 'decay': 1.0},
+    {'name': 'weekly-decay', 'days': 7, 'engine': 'memory',
+     'split': [0.6, 0.2, 0.2], 'decay': 0.99},
+    {'name': 'weekly-half', 'days': 7, 'engine': 'memory',
+     'split': [0.5, 0.25, 0.25], 'decay': 1.0},
+]
+processes = 3
+repeats = 3
+thresholds = {'runtime': 0.25, 'memory': 0.25, 'error': 0.01,
+              'entropy': 0.05, 'f1': 0.01, 'f2': 0.01}
+column_list = ['runtime', 'throughput', 'memory', 'error', 'entropy',
+               'f1', 'f2']
+
+
+# Module variable definitions:
+#   variant_list:   Pipeline variants to run, each naming its bundle days,
+#                   engine ('memory' or 'stream'), data split and decay
+#   processes:      Number of fresh processes each variant is timed in
+#   repeats:        Number of timed training runs per process, after one
+#                   untimed warm-up run that measures memory
+#   thresholds:     Allowed regression against the baseline, as a fraction
+#                   of the baseline for runtime and memory (CPU seconds, MB),
+#                   and as an absolute change for the accuracy rates
+#   column_list:    Report table columns, after the variant name
+
+# NOTE: Each variant trains in fresh processes, so no variant inherits the
+#   caches or heap of another.  Memory is the peak traced during the warm-up
+#   run, counting what training allocates and not the imported modules.
+#   Runtime is the CPU time of the fastest timed run of each process, so
+#   other work on the machine is not counted, and the median of those across
+#   processes, which run in rounds over all variants as the speed of the
+#   machine drifts.  Every variant uses the same seed, so accuracy changes
+#   come from the variant and not the random datasets
+
+# NOTE: Each variant preprocesses a copy of data.csv in its own temporary
+#   directory, starting from an empty category dictionary, so the report
+#   only ever writes baseline.csv to the data directory
+
+
+# Find the peak memory allocated while calling train, in megabytes
+def peak_memory(train):
+    tracemalloc.start()
+    try:
+        train()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024**2
+
+
+# Train the learning model for one variant, measuring runtime and memory
+def run_variant(variant, sets, seed, path, repeats):
+    def train():
+        learn(variant['days'], sets, seed, variant['decay'],
+              variant['engine'] == 'stream', path)
+
+    # Warm up while tracing memory, then time the untraced runs
+    runtimes = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        memory = peak_memory(train)
+        for run in range(repeats):
+            begin = time.process_time()
+            train()
+            runtimes.append(time.process_time() - begin)
+    return (min(runtimes), memory)
+
+
+# Find mean dataset rates and the training entry count of the run in path
+def collect_results(path):
+    with open(os.path.join(path, 'output.csv')) as file:
+        output = h.open_csv(file)
+    with open(os.path.join(path, 'train.csv')) as file:
+        entries = sum(1 for _ in h.iterate_csv(file))
+
+    results = {'entries': entries}
+    for key in ['error', 'entropy', 'f1', 'f2']:
+        results[key] = sum(float(row[key]) for row in output) / len(output)
+    return results
+
+
+# Find the regressions of a variant's results against its baseline row
+def compare(name, results, baseline):
+    regressions = []
+
+    for key, limit in thresholds.items():
+        value, base = results[key], float(baseline[key])
+        if key in ['runtime', 'memory']:
+            failed = value > base * (1 + limit)
+        elif key in ['f1', 'f2']:
+            failed = value < base - limit
+        else:
+            failed = value > base + limit
+
+        if failed:
+            regressions.append(f"{name}: {key} regressed from {base:.4f} "
+                               f"to {value:.4f}")
+    return regressions
+
+
+# Print results of every variant as a table
+def print_table(rows):
+    print(f"{'variant':<16}" + ''.join(f"{key:>12}" for key in column_list))
+    for row in rows:
+        print(f"{row['name']:<16}"
+              + ''.join(f"{row[key]:>12.4f}" for key in column_list))
+
+
+# Run each pipeline variant on the same dataset, reporting speed and accuracy
+#   and returning any regressions against the stored baseline
+def report(variants=None, sets=100, seed=0, save=False, processes=processes,
+           repeats=repeats):
+    print('\nREPORT:')
+    path = os.path.join(data_path, 'baseline.csv')
+    context = multiprocessing.get_context('spawn')
+
+    variants = variants or variant_list
+    with contextlib.ExitStack() as stack:
+
+        # Preprocess a copy of the dataset for each variant
+        variant_paths = []
+        for variant in variants:
+            variant_path = stack.enter_context(tempfile.TemporaryDirectory())
+            shutil.copy(os.path.join(data_path, 'data.csv'), variant_path)
+            with contextlib.redirect_stdout(io.StringIO()):
+                preprocess(*variant['split'], variant_path)
+            variant_paths.append(variant_path)
+
+        # Time the variants in turns, so a slow spell of the machine falls on
+        #   one sample of every variant rather than on every sample of one
+        samples = [[] for variant in variants]
+        for process in range(processes):
+            print(f"Running variants: round {process + 1} of {processes}")
+            for variant, variant_path, runs in zip(variants, variant_paths,
+                                                   samples):
+                with concurrent.futures.ProcessPoolExecutor(
+                        1, mp_context=context) as pool:
+                    runs.append(pool.submit(run_variant, variant, sets,
+                                            seed, variant_path,
+                                            repeats).result())
+
+        rows = []
+        for variant, variant_path, runs in zip(variants, variant_paths,
+                                               samples):
+            runtime = statistics.median(runtime for runtime, _ in runs)
+            row = dict(collect_results(variant_path), name=variant['name'],
+                       runtime=runtime,
+                       memory=max(memory for _, memory in runs))
+            row['throughput'] = row['entries'] / runtime
+            rows.append(row)
+    print_table(rows)
+
+    # Save results as the new baseline, or compare against the stored one
+    regressions = []
+    if save:
+        with open(path, 'w') as file:
+            writer = csv.DictWriter(file, fieldnames=['name'] + column_list,
+                                    extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Saved baseline for {len(rows)} variants to baseline.csv")
+    elif os.path.exists(path):
+        with open(path) as file:
+            baseline = {row['name']: row for row in h.open_csv(file)}
+        for row in rows:
+            if row['name'] in baseline:
+                regressions += compare(row['name'], row,
+                                       baseline[row['name']])
+
+        for regression in regressions:
+            print('REGRESSION:', regression)
+        print(f"Found {len(regressions)} regressions against baseline.csv")
+    else:
+        print('No baseline.csv found, run with --save to store one')
+    return regressions
+
+
+# DEBUG
+if __name__ == '__main__':
+    if report(save='--save' in sys.argv):
+        sys.exit(1)
@@ -0,0 +1,165 @@
+# Random-access storage of model outputs, read through a memory map
+import json
+import mmap
+import struct
+import contextlib
+import numpy as np
+
+
+# Global variables
+magic = b'TOGGLML1'
+footer_format = '<Q'
+dtypes = {'int': np.dtype('<i8'), 'float': np.dtype('<f8')}
+column_types = {'project': 'int', 'description': 'int', 'tags': 'int',
+                'duration': 'int', 'bundle': 'int', 'probability': 'float',
+                'error': 'float', 'entropy': 'float'}
+
+
+# File layout:
+#   magic           8 byte file signature
+#   bundles         One segment per bundle, holding each column in turn
+#   footer          JSON index of columns, bundle rows and column byte ranges
+#   length          Footer length as an unsigned 64-bit integer
+#   magic           8 byte file signature, repeated to validate the footer
+
+# Module variable definitions:
+#   column_types:   Storage type of each numeric model column, where any
+#                   column not listed is stored as strings
+
+# NOTE: Numeric columns are stored as little-endian 64-bit arrays.  String
+#   columns are stored as 64-bit end offsets followed by a UTF-8 blob, so a
+#   single bundle's values can be sliced out without decoding the rest
+
+
+# Find the storage type of a column from its name
+def column_type(name):
+    return column_types.get(name, 'str')
+
+
+# Pad the file with zeros to the next 8 byte boundary
+def align(file):
+    padding = -file.tell() % 8
+    file.write(b'\0' * padding)
+
+
+# Write the values of one column, returning its byte range(s)
+def write_column(file, kind, values):
+    align(file)
+    offset = file.tell()
+
+    if kind in dtypes:
+        file.write(np.asarray(values, dtype=dtypes[kind]).tobytes())
+        return [offset, file.tell() - offset]
+
+    # Encode strings and record the end offset of each value in the blob
+    encoded = [str(value).encode('utf-8') for value in values]
+    ends = np.cumsum([len(value) for value in encoded], dtype=np.int64)
+    file.write(ends.astype(dtypes['int']).tobytes())
+    data_offset = file.tell()
+    file.write(b''.join(encoded))
+    return [offset, data_offset - offset,
+            data_offset, file.tell() - data_offset]
+
+
+# Append a bundle of entries as a new segment of the model file
+def write_bundle(writer, index, bundle):
+    file, footer = writer['file'], writer['footer']
+
+    # Take column names from the first bundle written
+    if not footer['columns']:
+        footer['columns'] = [{'name': key, 'type': column_type(key)}
+                             for key in bundle[0]]
+
+    segment = {'bundle': index, 'start': footer['rows'],
+               'rows': len(bundle), 'columns': {}}
+    for column in footer['columns']:
+        name = column['name']
+        values = [entry[name] for entry in bundle]
+        segment['columns'][name] = write_column(file, column['type'], values)
+
+    footer['bundles'].append(segment)
+    footer['rows'] += len(bundle)
+
+
+# Create a new model file, finishing the footer once all bundles are written
+@contextlib.contextmanager
+def create_model(path):
+    with open(path, 'wb') as file:
+        file.write(magic)
+        writer = {'file': file,
+                  'footer': {'rows': 0, 'columns': [], 'bundles': []}}
+        yield writer
+
+        footer = json.dumps(writer['footer']).encode('utf-8')
+        file.write(footer)
+        file.write(struct.pack(footer_format, len(footer)))
+        file.write(magic)
+
+
+# Map a model file into memory, reading only the footer index
+@contextlib.contextmanager
+def open_model(path):
+    with open(path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        # Validate signatures and locate the footer from the end of the file
+        size = struct.calcsize(footer_format)
+        end = len(buffer) - len(magic)
+        if buffer[:len(magic)] != magic or buffer[end:] != magic:
+            raise ValueError(f"{path} is not a toggl-ml model file")
+        length, = struct.unpack(footer_format, buffer[end - size:end])
+        footer = json.loads(buffer[end - size - length:end - size])
+
+        model = {'buffer': buffer, 'rows': footer['rows'],
+                 'columns': {column['name']: column['type']
+                             for column in footer['columns']},
+                 'bundles': {segment['bundle']: segment
+                             for segment in footer['bundles']}}
+        yield model
+    finally:
+        # Column views still held by the caller keep the map open until freed
+        with contextlib.suppress(BufferError):
+            buffer.close()
+
+
+# Read one column for a single bundle, without copying numeric values
+def read_segment(model, name, segment):
+    buffer, kind = model['buffer'], model['columns'][name]
+    ranges = segment['columns'][name]
+
+    if kind in dtypes:
+        return np.frombuffer(buffer, dtype=dtypes[kind],
+                             count=segment['rows'], offset=ranges[0])
+
+    # Slice each string from the blob using the stored end offsets
+    ends = np.frombuffer(buffer, dtype=dtypes['int'], count=segment['rows'],
+                         offset=ranges[0])
+    data = buffer[ranges[2]:ranges[2] + ranges[3]]
+    values, start = [], 0
+    for end in ends.tolist():
+        values.append(data[start:end].decode('utf-8'))
+        start = end
+    return values
+
+
+# Read a column from the given bundle, or from every bundle if none is given
+def read_column(model, name, bundle=None):
+    if name not in model['columns']:
+        raise KeyError(f"Unknown model column '{name}'")
+
+    if bundle is not None:
+        if bundle not in model['bundles']:
+            raise KeyError(f"Unknown model bundle '{bundle}'")
+        return read_segment(model, name, model['bundles'][bundle])
+
+    segments = [read_segment(model, name, segment)
+                for segment in model['bundles'].values()]
+    if model['columns'][name] in dtypes:
+        return np.concatenate(segments)
+    return [value for segment in segments for value in segment]
+
+
+# DEBUG
+if __name__ == '__main__':
+    print('ERROR: store.py should not be executed on its own')
@@ -0,0 +1,243 @@
+# Registry of probability terms combined by the live learning model
+import math
+import dateutil.parser
+import helper as h
+from scipy import special
+
+
+# Global variables
+column_list = {}
+term_list = []
+rescale_limit = 1e-8
+prune_limit = 0.01
+
+
+# Module variable definitions:
+#   column_list:    Typed column converters, keyed by column name
+#   term_list:      Registered probability terms, applied in order
+#   rescale_limit:  Decay scale at which stored categorical counts are rescaled
+#   prune_limit:    Decayed total below which a category is forgotten
+
+# NOTE: A term is a dictionary holding its name, the typed columns it reads,
+#   a setup function returning its initial state from the model context, and
+#   an update function called once per entry as
+#       update(state, modified, *values) -> (state, probability)
+#   All terms are fused into a single pass over each bundle by run_model, and
+#   term state never leaves the term, so adding a term adds no entry keys.
+#   Updates are sequential by design, as every entry is scored against the
+#   state left by the entries before it
+
+# NOTE: The model context may set a forgetting factor 'decay' in (0, 1],
+#   where 1.0 keeps every past entry at full weight.  Below 1.0, categorical
+#   counts shrink toward their prior on every entry, and the time and duration
+#   hyperparameters of a class shrink by the factor before each update, so
+#   all term state stays bounded however long a bundle runs.  Below 1.0 every
+#   entry is also scored before its own update, as its own label would
+#   otherwise outweigh the decayed history and leak into its score
+
+
+# Register a typed column, built from the raw value(s) of each entry
+def register_column(name, convert):
+    column_list[name] = convert
+
+
+# Register a probability term, reading the given columns on every update
+def register_term(name, columns, setup, update):
+    for column in columns:
+        if column not in column_list:
+            raise KeyError(f"Unknown column '{column}' for term '{name}'")
+    term_list.append({'name': name, 'columns': columns,
+                      'setup': setup, 'update': update})
+
+
+# Convert the bundle entries once into the typed columns the terms require
+def build_columns(bundle):
+    names = {'modified'}
+    for term in term_list:
+        names.update(term['columns'])
+
+    columns = {}
+    for name in names:
+        convert = column_list[name]
+        columns[name] = [convert(entry) for entry in bundle]
+    return columns
+
+
+# Create the initial state of every registered term, from a copy of the model
+#   context that terms set up for the same bundle can share state through
+def setup_terms(context):
+    context = dict(context)
+    return [term['setup'](context) for term in term_list]
+
+
+# Find the columns each term reads, in registry order, without copying them
+def term_columns(columns):
+    return [[columns[name] for name in term['columns']] for term in term_list]
+
+
+# COLUMNS
+
+# Convert an entry time to its hour angle on the unit circle
+def hour_angle(value):
+    return (dateutil.parser.parse(value).hour / 24) * (2*math.pi)
+
+
+register_column('modified', lambda entry: entry['modified'] == 'True')
+register_column('start', lambda entry: hour_angle(entry['start']))
+register_column('end', lambda entry: hour_angle(entry['end']))
+register_column('duration',
+                lambda entry: int(entry['duration']) / 3600000 / 24 / 7)
+for feature in h.feature_list:
+    register_column(feature,
+                    lambda entry, feature=feature: int(entry[feature]))
+del feature
+
+
+# TERMS
+
+# Find the forgetting factor state every term starts from
+def setup_decay(context):
+    decay = context.get('decay', 1.0)
+    return {'decay': decay, 'score_first': decay < 1}
+
+
+# Create empty categorical counts and the running modified totals (alpha)
+def setup_categorical(context):
+    return dict(setup_decay(context), beta=h.setup_beta(), alpha=[0, 0],
+                scale=1.0)
+
+
+# Find logarithmic probability for the categorical features
+def categorical_probability(beta, alpha, values, scale):
+
+    # Compute prior probability of an entry being modified, termed as theta
+    theta = h.compute_theta(beta, alpha, scale)
+    return math.log(theta / (1-theta)) + h.sum_log_ratios(beta, values, scale)
+
+
+# Determine probabilities for categorical features on time entry
+def update_categorical(state, modified, *values):
+    beta, alpha = state['beta'], state['alpha']
+
+    # Decay all counts at once by scaling up the weight of new counts, only
+    #   rescaling the stored counts when that weight grows too large
+    state['scale'] *= state['decay']
+    if state['scale'] < rescale_limit:
+        alpha = h.rescale_beta(beta, state['scale'], prune_limit)
+        state['scale'] = 1.0
+    weight = 1 / state['scale']
+
+    if state['score_first']:
+        prob_categorical = categorical_probability(beta, alpha, values,
+                                                   state['scale'])
+
+    # Update beta features with new entry, tracking the prior manual updates
+    for feature, value in zip(h.feature_list, values):
+        alpha = h.update_beta(beta[feature], value, modified, alpha, weight)
+
+    if not state['score_first']:
+        prob_categorical = categorical_probability(beta, alpha, values,
+                                                   state['scale'])
+    state['alpha'] = alpha
+
+    return (state, prob_categorical)
+
+
+# Create initial von Mises hyperparameters, a & b, for the target time
+#   NOTE: The start and end terms share one set of hyperparameters, and only
+#   the end term saves its updated values, so the start term always reads the
+#   values left by the previous entry's end time
+def setup_time(target):
+    def setup(context):
+        hyper = context.setdefault('time', {
+            'a_0': math.pi, 'a_1': math.pi,
+            'b_0': 1 / (2*(math.pi**2)), 'b_1': 1 / (2*(math.pi**2))})
+        return dict(setup_decay(context), kappa=context[f"kappa_{target}"],
+                    hyper=hyper, save=(target == 'end'))
+    return setup
+
+
+# Find logarithmic probability for target time x from the hyperparameters
+def time_probability(x, a_0, a_1, b_0, b_1):
+
+    # Find logaritmic Bessel function ratio
+    bessel = math.log(special.iv(0, a_0) / special.iv(0, a_1))
+    return ((a_1 * math.cos(x-b_1)) - (a_0 * math.cos(x-b_0))) + bessel
+
+
+# Determine probabilities for target time features on time entry
+def update_time(state, modified, x):
+    hyper = state['hyper']
+    a_0, a_1 = hyper['a_0'], hyper['a_1']
+    b_0, b_1 = hyper['b_0'], hyper['b_1']
+    kappa, decay = state['kappa'], state['decay']
+
+    if state['score_first']:
+        prob_time = time_probability(x, a_0, a_1, b_0, b_1)
+
+    # Update von Mises hyperparameters with the new value of target time x,
+    #   forgetting part of the prior concentration
+    if not modified:
+        a_0, b_0 = h.update_hyperparameters(x, decay * a_0, b_0, kappa)
+    else:
+        a_1, b_1 = h.update_hyperparameters(x, decay * a_1, b_1, kappa)
+
+    # Compute final time probability and save values
+    if not state['score_first']:
+        prob_time = time_probability(x, a_0, a_1, b_0, b_1)
+    if state['save']:
+        hyper['a_0'], hyper['a_1'] = a_0, a_1
+        hyper['b_0'], hyper['b_1'] = b_0, b_1
+
+    return (state, prob_time)
+
+
+# Create initial gamma hyperparameters, c & d, for the duration
+def setup_duration(context):
+    return dict(setup_decay(context), c_0=1, c_1=1, d_0=1, d_1=1)
+
+
+# Find logarithmic probability for duration x from the hyperparameters
+def duration_probability(x, c_0, c_1, d_0, d_1):
+
+    # Log of the ratio of the probability of duration
+    term_cd = (d_0*c_1 - d_1*c_0) / (d_0*d_1)
+    term_log_cd = math.log(c_1/c_0) + math.log(d_0 / d_1)
+    return term_cd * (-x) * term_log_cd
+
+
+# Determine probability for duration feature on time entry
+def update_duration(state, modified, x):
+    c_0, c_1 = state['c_0'], state['c_1']
+    d_0, d_1 = state['d_0'], state['d_1']
+    decay = state['decay']
+
+    if state['score_first']:
+        prob_duration = duration_probability(x, c_0, c_1, d_0, d_1)
+
+    # Update gamma hyperparameters with new value of duration x, forgetting
+    #   part of the prior shape and inverse scale
+    if not modified:
+        c_0, d_0 = (decay * c_0) + 1, (d_0 / (decay + d_0*x))
+    else:
+        c_1, d_1 = (decay * c_1) + 1, (d_1 / (decay + d_1*x))
+
+    # Compute final duration probability and save values
+    if not state['score_first']:
+        prob_duration = duration_probability(x, c_0, c_1, d_0, d_1)
+    state['c_0'], state['d_0'] = c_0, d_0
+    state['c_1'], state['d_1'] = c_1, d_1
+
+    return (state, prob_duration)
+
+
+register_term('categorical', h.feature_list, setup_categorical,
+              update_categorical)
+register_term('time_start', ['start'], setup_time('start'), update_time)
+register_term('time_end', ['end'], setup_time('end'), update_time)
+register_term('duration', ['duration'], setup_duration, update_duration)
+
+
+# DEBUG
+if __name__ == '__main__':
+    print('ERROR: terms.py should not be executed on its own')